@@ -0,0 +1,96 @@
+import webdataset as wds
+import soundfile as sf
+import numpy as np
+import io
+import os
+import glob
+import shutil
+import argparse
+import torch
+from multiprocessing import Pool
+from tqdm import tqdm
+from training.data_utils import int16_to_float32, float32_to_int16, resample, log_and_continue
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--tar-path",
+        type=str,
+        required=True,
+        help="Path to the folder of tars to convert",
+    )
+    parser.add_argument(
+        "--output-path",
+        type=str,
+        required=True,
+        help="Path to the folder where the converted tars are written",
+    )
+    parser.add_argument(
+        "--sample-rate",
+        type=int,
+        default=48000,
+        help="The sample rate of the audio model (audio_cfg['sample_rate'])",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of tars converted in parallel",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def decode_audio(audio_bytes, sample_rate):
+    """
+    Decode, downmix, quantize and resample a flac the same way as training.data.preprocess.
+    """
+    audio_data, orig_sr = sf.read(io.BytesIO(audio_bytes), dtype="float32")
+    if audio_data.ndim > 1:
+        audio_data = audio_data.mean(axis=-1, dtype=np.float32)
+    audio_data = torch.from_numpy(int16_to_float32(float32_to_int16(audio_data)))
+    if orig_sr != sample_rate:
+        audio_data = resample(audio_data, orig_sr, sample_rate)
+    return audio_data.numpy()
+
+
+def convert_tar(job):
+    """
+    job: (tar_path, output_path, sample_rate)
+    Rewrite one tar with the audio stored as raw float32 ("f32") at sample_rate.
+    The text json is kept as is, it is tokenized at training time.
+    """
+    tar_path, output_path, sample_rate = job
+    pipeline = wds.DataPipeline(
+        wds.SimpleShardList([tar_path]),
+        wds.tarfile_to_samples(handler=log_and_continue),
+    )
+    with wds.TarWriter(output_path) as sink:
+        for sample in pipeline:
+            sink.write(
+                {
+                    "__key__": sample["__key__"],
+                    "f32": decode_audio(sample["flac"], sample_rate).tobytes(),
+                    "sr": str(sample_rate).encode(),
+                    "json": sample["json"],
+                }
+            )
+    return output_path
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.output_path, exist_ok=True)
+    tar_list = sorted(glob.glob(os.path.join(args.tar_path, "*.tar")))
+    jobs = [
+        (t, os.path.join(args.output_path, os.path.basename(t)), args.sample_rate)
+        for t in tar_list
+    ]
+    with Pool(args.workers) as pool:
+        for _ in tqdm(pool.imap_unordered(convert_tar, jobs), total=len(jobs)):
+            pass
+    # the number of samples per tar does not change
+    for size_file in ["sizes.json", "__len__"]:
+        if os.path.exists(os.path.join(args.tar_path, size_file)):
+            shutil.copy(os.path.join(args.tar_path, size_file), args.output_path)
@@ -1,4 +1,5 @@
 import ast
+import hashlib
 import json
 import logging
 import math
@@ -7,19 +8,19 @@ import random
 import h5py
 from dataclasses import dataclass
 from training.params import parse_args
+from training.distributed import world_info_from_env
 import braceexpand
 import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
 import torchvision.datasets as datasets
 import torchvision.transforms
 import webdataset as wds
 from PIL import Image
 from torch.utils.data import Dataset, DataLoader, SubsetRandomSampler
 from torch.utils.data.distributed import DistributedSampler
-from functools import partial
+from functools import partial, lru_cache
 import soundfile as sf
 import io
 from pathlib import Path
@@ -27,6 +28,7 @@ import wget
 
 from open_clip.utils import get_tar_path_from_dataset_name, dataset_split
 from open_clip.utils import load_p, load_class_label
+from training.data_utils import int16_to_float32, float32_to_int16, resample, log_and_continue
 import tempfile
 import copy
 
@@ -40,6 +42,30 @@ try:
 except ImportError:
     torchaudio = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa_csv = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+except ImportError:
+    TurboJPEG = None
+
+try:
+    import nvidia.dali.fn as dali_fn
+    import nvidia.dali.math as dali_math
+    import nvidia.dali.types as dali_types
+    from nvidia.dali import pipeline_def
+    from nvidia.dali.plugin.pytorch import DALIGenericIterator, LastBatchPolicy
+except ImportError:
+    dali_fn = None
+
 args = parse_args()
 if args.tmodel == "transformer":
     from open_clip import tokenize
@@ -89,18 +115,47 @@ elif args.tmodel == "bart":
         )
         return {k: v.squeeze(0) for k, v in result.items()}
 
+
+def batch_tokenizer(texts):
+    """Tokenize a list of texts in one call, the outputs have shape (batch, context_length)."""
+    if args.tmodel == "transformer":
+        return tokenize(texts)
+    result = tokenize(
+        texts,
+        padding="max_length",
+        truncation=True,
+        max_length=77,
+        return_tensors="pt",
+    )
+    return {k: v for k, v in result.items()}
+
+
 # initizlied the audioset map
 _AUDIOSET_MAP_PATH = os.path.join(Path(__file__).parent, "audioset_textmap.npy")
 _AUDIOSET_MAP = np.load(_AUDIOSET_MAP_PATH, allow_pickle=True)
 
 
-def int16_to_float32(x):
-    return (x / 32767.0).astype(np.float32)
+_rng = None
+
+
+def _reset_rng():
+    global _rng
+    _rng = None
 
 
-def float32_to_int16(x):
-    x = np.clip(x, a_min=-1., a_max=1.)
-    return (x * 32767.).astype(np.int16)
+# a forked dataloader worker must not reuse the generator of its parent
+os.register_at_fork(after_in_child=_reset_rng)
+
+
+def get_rng():
+    """
+    Return a numpy Generator owned by the current process. It is created lazily after the
+    dataloader workers are forked and seeded from torch, which gives each worker its own seed.
+    """
+    global _rng
+    if _rng is None:
+        _rng = np.random.default_rng(torch.initial_seed())
+    return _rng
 
 
 # For Toy Dataset
@@ -246,24 +301,68 @@ class ToyDataset(Dataset):
 
 
 class CsvDataset(Dataset):
-    def __init__(self, input_filename, transforms, img_key, caption_key, sep="\t"):
+    def __init__(self, input_filename, transforms, img_key, caption_key, sep="\t", decoder="pil"):
+        assert decoder in ["pil", "turbojpeg"], f"Unsupported image decoder: {decoder}"
+        assert decoder != "turbojpeg" or TurboJPEG is not None, "Please install PyTurboJPEG to use the turbojpeg decoder."
         logging.debug(f"Loading csv data from {input_filename}.")
-        df = pd.read_csv(input_filename, sep=sep)
-
-        self.images = df[img_key].tolist()
-        self.captions = df[caption_key].tolist()
+        if pa_csv is not None and len(sep) == 1:
+            # multithreaded parse, columns go straight to python lists without a DataFrame
+            # (pyarrow only supports single-character delimiters, others go through pandas)
+            table = pa_csv.read_csv(
+                input_filename,
+                parse_options=pa_csv.ParseOptions(delimiter=sep),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types={img_key: "string", caption_key: "string"}
+                ),
+            )
+            self.images = table[img_key].to_pylist()
+            self.captions = table[caption_key].to_pylist()
+        else:
+            df = pd.read_csv(
+                input_filename,
+                sep=sep,
+                dtype={img_key: str, caption_key: str},
+                keep_default_na=False,
+            )
+            self.images = df[img_key].tolist()
+            self.captions = df[caption_key].tolist()
         self.transforms = transforms
+        self.decoder = decoder
+        self.jpeg_decoder = None
         logging.debug("Done loading data.")
 
     def __len__(self):
         return len(self.captions)
 
+    def load_image(self, path):
+        # with the turbojpeg decoder, jpegs are decoded with libjpeg-turbo,
+        # other formats (or a Pillow-SIMD install) go through PIL
+        if self.decoder == "turbojpeg" and path.lower().endswith((".jpg", ".jpeg")):
+            if self.jpeg_decoder is None:
+                # created lazily so that each dataloader worker owns its decoder handle
+                self.jpeg_decoder = TurboJPEG()
+            with open(path, "rb") as f:
+                try:
+                    return Image.fromarray(self.jpeg_decoder.decode(f.read(), pixel_format=TJPF_RGB))
+                except OSError:
+                    # mislabeled files (e.g. png named .jpg) and jpegs libjpeg-turbo cannot convert
+                    pass
+        return Image.open(path)
+
     def __getitem__(self, idx):
-        images = self.transforms(Image.open(str(self.images[idx])))
-        texts = tokenize([str(self.captions[idx])])[0]
+        images = self.transforms(self.load_image(self.images[idx]))
+        texts = self.captions[idx]  # tokenized per batch in csv_collate_fn
         return images, texts
 
 
+def csv_collate_fn(batch):
+    """
+    Collate function for CsvDataset, tokenizing all the captions of a batch in one call.
+    """
+    images, texts = zip(*batch)
+    return torch.stack(images), batch_tokenizer(list(texts))
+
+
 @dataclass
 class DataInfo:
     dataloader: DataLoader
@@ -274,43 +373,47 @@ def preprocess_txt(text):
     return tokenize([str(text)])[0]
 
 
+@lru_cache(maxsize=None)
+def _load_sizes(sizes_filename):
+    """
+    Load a sizes.json file, parsed once per path and shared by all the shards listed in it.
+    """
+    with open(sizes_filename, "r") as f:
+        return json.load(f)
+
+
 def get_dataset_size(shards, sizefilepath_=None, is_local=True):
-    if isinstance(shards, list):
-        size_list = []
-        for s in shards:
-            size_list.append(
-                get_dataset_size(s, sizefilepath_=sizefilepath_, is_local=is_local)[0]
-            )
-    else:
+    total_size = 0
+    for shard_pattern in shards if isinstance(shards, list) else [shards]:
+        sizefilepath = sizefilepath_
         if not is_local:
+            path_parts = shard_pattern.split("/")
             for n in dataset_split.keys():
-                if n in shards.split("/"):
+                if n in path_parts:
                     break
             for s in dataset_split[n]:
-                if s in shards.split("/"):
+                if s in path_parts:
                     break
-            sizefilepath_ = f"./json_files/{n}/{s}/sizes.json"
-        shards_list = list(braceexpand.braceexpand(shards))
-        dir_path = os.path.dirname(shards)
-        if sizefilepath_ is not None:
-            sizes = json.load(open(sizefilepath_, "r"))
-            total_size = sum(
-                [
-                    int(sizes[os.path.basename(shard.replace(".tar -", ".tar"))])
-                    for shard in shards_list
-                ]
+            sizefilepath = f"./json_files/{n}/{s}/sizes.json"
+        shards_list = list(braceexpand.braceexpand(shard_pattern))
+        dir_path = os.path.dirname(shard_pattern)
+        if sizefilepath is not None:
+            sizes = _load_sizes(sizefilepath)
+            total_size += sum(
+                int(sizes[shard.replace(".tar -", ".tar").rpartition("/")[2]])
+                for shard in shards_list
             )
         else:
             sizes_filename = os.path.join(dir_path, "sizes.json")
             len_filename = os.path.join(dir_path, "__len__")
             if os.path.exists(sizes_filename):
-                sizes = json.load(open(sizes_filename, "r"))
-                total_size = sum(
-                    [int(sizes[os.path.basename(shard)]) for shard in shards_list]
+                sizes = _load_sizes(sizes_filename)
+                total_size += sum(
+                    int(sizes[shard.rpartition("/")[2]]) for shard in shards_list
                 )
             elif os.path.exists(len_filename):
                 # FIXME this used to be eval(open(...)) but that seemed rather unsafe
-                total_size = ast.literal_eval(open(len_filename, "r").read())
+                total_size += ast.literal_eval(open(len_filename, "r").read())
             else:
                 raise Exception(
                     "Cannot find sizes file for dataset. Please specify the path to the file."
@@ -320,11 +423,10 @@ def get_dataset_size(shards, sizefilepath_=None, is_local=True):
                 # cc3m-train: 2905954
                 # cc12m: 10968539
                 # LAION-400m: 407332084
-        num_shards = len(shards_list)
     if isinstance(shards, list):
-        return sum(size_list), len(shards)
+        return total_size, len(shards)
     else:
-        return total_size, num_shards
+        return total_size, len(shards_list)
 
 
 def get_imagenet(args, preprocess_fns, split):
@@ -348,19 +450,14 @@ def get_imagenet(args, preprocess_fns, split):
         dataset = datasets.ImageFolder(data_path, transform=preprocess_fn)
 
     if is_train:
-        idxs = np.zeros(len(dataset.targets))
         target_array = np.array(dataset.targets)
         k = 50
-        for c in range(1000):
-            m = target_array == c
-            n = len(idxs[m])
-            arr = np.zeros(n)
-            arr[:k] = 1
-            np.random.shuffle(arr)
-            idxs[m] = arr
-
-        idxs = idxs.astype("int")
-        sampler = SubsetRandomSampler(np.where(idxs)[0])
+        # shuffle within each class by sorting on (class, random key), then keep the first k of the first 1000 classes
+        order = np.lexsort((np.random.rand(len(target_array)), target_array))
+        sorted_targets = target_array[order]
+        rank_in_class = np.arange(len(order)) - np.searchsorted(sorted_targets, sorted_targets)
+        idxs = np.sort(order[(rank_in_class < k) & (sorted_targets < 1000)])
+        sampler = SubsetRandomSampler(idxs)
     else:
         sampler = None
 
@@ -388,33 +485,42 @@ def filter_no_caption(sample):
     return "txt" in sample
 
 
-def log_and_continue(exn):
-    """Call in an exception handler to ignore any exception, isssue a warning, and continue."""
-    logging.warning(f"Handling webdataset error ({repr(exn)}). Ignoring.")
-    return True
-
-
 _SHARD_SHUFFLE_SIZE = 2000
 _SHARD_SHUFFLE_INITIAL = 500
 _SAMPLE_SHUFFLE_SIZE = 5000
 _SAMPLE_SHUFFLE_INITIAL = 1000
 
 
+def download_sizefile(url):
+    """
+    Download a remote sizes file to a cache path derived from the url, and return the local path.
+    In distributed training only the local master of each node downloads, the others wait for it.
+    """
+    cache_path = os.path.join(
+        tempfile.gettempdir(), f"sizes_{hashlib.md5(url.encode()).hexdigest()}.json"
+    )
+    distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+    local_rank, _, _ = world_info_from_env()
+    if not os.path.exists(cache_path) and (local_rank == 0 or not distributed):
+        # download to a process-specific file first so readers never see a partial file
+        tmp_path = wget.download(url, f"{cache_path}.{os.getpid()}.tmp")
+        os.replace(tmp_path, cache_path)
+    if distributed:
+        torch.distributed.barrier()
+    return cache_path
+
+
 def sample_prop(sizefile, inputs, proportion, is_local=True):
     """
     Sample a proportion of the data.
     """
     file_path_dict = {
-        os.path.split(inputs[i])[1]: os.path.split(inputs[i])[0]
-        for i in range(len(inputs))
+        file_name: dir_path for dir_path, file_name in map(os.path.split, inputs)
     }
     sampled_filepath_dict = {}
     sampled_size_dict = {}
     if not is_local:
-        if os.path.exists("sizes.json"):
-            os.remove("sizes.json")
-        wget.download(sizefile, "sizes.json")
-        sizefile = "sizes.json"
+        sizefile = download_sizefile(sizefile)
     with open(sizefile, "r", encoding="UTF-8") as f:
         load_dict = json.load(f)
     L = int(len(file_path_dict) * proportion)
@@ -466,6 +572,21 @@ def get_mel(audio_data,audio_cfg):
     return mel.T  # (T, n_mels)
 
 
+def fit_to_length(out, audio_data, n_valid):
+    """
+    Fill out with audio_data repeated for the first n_valid values and zeros after.
+    The filled prefix is doubled with whole-block copies, so short clips need few copies.
+    """
+    filled = min(len(audio_data), n_valid)
+    out[:filled] = audio_data[:filled]
+    while filled < n_valid:
+        step = min(filled, n_valid - filled)
+        out[filled:filled + step] = out[:step]
+        filled += step
+    out[n_valid:] = 0.0
+    return out
+
+
 def get_audio_features(sample, audio_data, max_len, data_truncating, data_filling, audio_cfg):
     """
     Calculate and add audio features to sample.
@@ -494,21 +615,17 @@ def get_audio_features(sample, audio_data, max_len, data_truncating, data_fillin
                     sample["mel_fusion"] = mel_fusion
                     longer = torch.tensor([False])
                 else:
-                    ranges = np.array_split(list(range(0, total_frames-chunk_frames+1)), 3)
-                    # print('total_frames-chunk_frames:', total_frames-chunk_frames,
-                    #       'len(audio_data):', len(audio_data),
-                    #       'chunk_frames:', chunk_frames,
-                    #       'total_frames:', total_frames)
-                    if len(ranges[1]) == 0:
-                        # if the audio is too short, we just use the first chunk
-                        ranges[1] = [0]
-                    if len(ranges[2]) == 0:
-                        # if the audio is too short, we just use the first chunk
-                        ranges[2] = [0]
+                    # split the valid start frames into three parts (same sizes as np.array_split)
+                    n_starts = total_frames - chunk_frames + 1
+                    part_sizes = n_starts // 3 + (np.arange(3) < n_starts % 3)
+                    part_offsets = np.cumsum(part_sizes) - part_sizes
                     # randomly choose index for each part
-                    idx_front = np.random.choice(ranges[0])
-                    idx_middle = np.random.choice(ranges[1])
-                    idx_back = np.random.choice(ranges[2])
+                    # if the audio is too short, an empty part just uses the first chunk
+                    idx_front, idx_middle, idx_back = np.where(
+                        part_sizes > 0,
+                        part_offsets + get_rng().integers(0, np.maximum(part_sizes, 1)),
+                        0,
+                    )
                     # select mel
                     mel_chunk_front = mel[idx_front:idx_front+chunk_frames, :]
                     mel_chunk_middle = mel[idx_middle:idx_middle+chunk_frames, :]
@@ -528,36 +645,28 @@ def get_audio_features(sample, audio_data, max_len, data_truncating, data_fillin
                 )
             # random crop to max_len (for compatibility)
             overflow = len(audio_data) - max_len
-            idx = np.random.randint(0, overflow + 1)
+            idx = get_rng().integers(0, overflow + 1)
             audio_data = audio_data[idx: idx + max_len]
 
         else:  # padding if too short
             if len(audio_data) < max_len:  # do nothing if equal
                 if data_filling == "repeatpad":
                     n_repeat = int(max_len/len(audio_data))
-                    audio_data = audio_data.repeat(n_repeat)
+                    n_valid = n_repeat * len(audio_data)
                     # audio_data = audio_data.unsqueeze(0).unsqueeze(0).unsqueeze(0)
                     # audio_data = F.interpolate(audio_data,size=max_len,mode="bicubic")[0,0,0]
-                    audio_data = F.pad(
-                        audio_data,
-                        (0, max_len - len(audio_data)),
-                        mode="constant",
-                        value=0,
-                    )
                 elif data_filling == "pad":
-                    audio_data = F.pad(
-                        audio_data,
-                        (0, max_len - len(audio_data)),
-                        mode="constant",
-                        value=0,
-                    )
+                    n_valid = len(audio_data)
                 elif data_filling == "repeat":
-                    n_repeat = int(max_len/len(audio_data))
-                    audio_data = audio_data.repeat(n_repeat+1)[:max_len]
+                    n_valid = max_len
                 else:
                     raise NotImplementedError(
                         f"data_filling {data_filling} not implemented"
                     )
+                # repeat and zero-fill into a single new buffer instead of repeat() followed by F.pad()
+                audio_data = torch.from_numpy(
+                    fit_to_length(np.empty(max_len, dtype=np.float32), audio_data.numpy(), n_valid)
+                )
             if data_truncating == 'fusion':
                 mel = get_mel(audio_data, audio_cfg)
                 mel_fusion = torch.stack([mel, mel, mel, mel], dim=0)
@@ -570,6 +679,47 @@ def get_audio_features(sample, audio_data, max_len, data_truncating, data_fillin
     return sample
 
 
+def load_json_bytes(raw_bytes):
+    """
+    Parse the json of a sample, with orjson if available.
+    orjson rejects the NaN/Infinity literals that json.dump writes by default,
+    so those samples are parsed with the stdlib json module.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(raw_bytes)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(raw_bytes.decode("utf-8"))
+
+
+def select_text(json_dict_raw, text_augment_selection=None):
+    """
+    Select the text (or list of texts) of a sample from its json.
+    """
+    # For selecting augmented text from dataset
+    if text_augment_selection is None or text_augment_selection == "none":
+        texts = json_dict_raw["text"]
+    elif text_augment_selection == "all":
+        if "text_augment_all" in json_dict_raw.keys():
+            texts = json_dict_raw["text_augment_all"]
+        else:
+            texts = json_dict_raw["text"]
+    elif text_augment_selection == "augment_only":
+        if "text_augment_all" in json_dict_raw.keys():
+            if json_dict_raw["text_augment_t5"] is None:
+                texts = json_dict_raw["text"]
+            else:
+                texts = json_dict_raw["text_augment_t5"]
+        else:
+            texts = json_dict_raw["text"]
+    else:
+        raise NotImplementedError(
+            f"text_augment_selection {text_augment_selection} not implemented"
+        )
+    return texts
+
+
 def preprocess(
     sample,
     audio_ext,
@@ -584,9 +734,34 @@ def preprocess(
     """
     Preprocess a single sample for wdsdataloader.
     """
-    audio_data, orig_sr = sf.read(io.BytesIO(sample[audio_ext]))
-    audio_data = int16_to_float32(float32_to_int16(audio_data))
-    audio_data = torch.tensor(audio_data).float()
+    if "f32" in sample:
+        # tars written by convert_tars.py already hold mono, quantized float32 audio
+        audio_data = np.frombuffer(bytearray(sample.pop("f32")), dtype=np.float32)
+        audio_data = torch.from_numpy(audio_data)
+        orig_sr = int(sample.pop("sr"))
+        crop = False
+    else:
+        with sf.SoundFile(io.BytesIO(sample.pop(audio_ext))) as f:
+            orig_sr = f.samplerate
+            crop = (
+                data_truncating == "rand_trunc"
+                and orig_sr == audio_cfg["sample_rate"]
+                and f.channels == 1
+                and f.frames > max_len
+            )
+            if crop:
+                # decode only the random max_len window, straight into a float32 buffer
+                f.seek(int(get_rng().integers(0, f.frames - max_len + 1)))
+                audio_data = f.read(out=np.empty(max_len, dtype=np.float32))
+            else:
+                audio_data = f.read(dtype="float32")
+        if audio_data.ndim > 1:
+            # downmix (T, channels) to mono before quantizing and resampling a single channel
+            audio_data = audio_data.mean(axis=-1, dtype=np.float32)
+        audio_data = int16_to_float32(float32_to_int16(audio_data))
+        audio_data = torch.from_numpy(audio_data)
+    if orig_sr != audio_cfg["sample_rate"]:
+        audio_data = resample(audio_data, orig_sr, audio_cfg["sample_rate"])
 
     # TODO: (yusong) to be include in the future
     # # if torchaudio not installed, use soundfile to load audio
@@ -603,40 +778,28 @@ def preprocess(
     #         audio_data, orig_sr = torchaudio.load(fname)
     #         audio_data = audio_data[0, :].float()
 
-    sample = get_audio_features(sample, audio_data, max_len, data_truncating, data_filling, audio_cfg)
-    del sample[audio_ext]
+    if crop:
+        sample["longer"] = torch.tensor([True])
+        sample["waveform"] = audio_data
+    elif data_filling == "pad" and data_truncating != "fusion" and len(audio_data) < max_len:
+        # zero padding is deferred to collate_fn, which fills a single (batch, max_len) buffer
+        sample["longer"] = torch.tensor([False])
+        sample["waveform"] = audio_data
+    else:
+        sample = get_audio_features(sample, audio_data, max_len, data_truncating, data_filling, audio_cfg)
 
     try:
-        json_dict_raw = json.loads(sample[text_ext].decode("utf-8"))
+        json_dict_raw = load_json_bytes(sample[text_ext])
     except:
         print("sample[__url__]:", sample["__url__"])
 
-    # For selecting augmented text from dataset
-    if text_augment_selection is None or text_augment_selection == "none":
-        texts = json_dict_raw["text"]
-    elif text_augment_selection == "all":
-        if "text_augment_all" in json_dict_raw.keys():
-            texts = json_dict_raw["text_augment_all"]
-        else:
-            texts = json_dict_raw["text"]
-    elif text_augment_selection == "augment_only":
-        if "text_augment_all" in json_dict_raw.keys():
-            if json_dict_raw["text_augment_t5"] is None:
-                texts = json_dict_raw["text"]
-            else:
-                texts = json_dict_raw["text_augment_t5"]
-        else:
-            texts = json_dict_raw["text"]
-    else:
-        raise NotImplementedError(
-            f"text_augment_selection {text_augment_selection} not implemented"
-        )
+    texts = select_text(json_dict_raw, text_augment_selection)
     sample["full_text"] = texts
 
     if isinstance(texts, list) and isinstance(texts[0], str) and len(texts) > 1:
         texts = random.choice(texts)
     sample["raw_text"] = texts
-    sample["text"] = tokenizer(texts)  # text shape: [num_token]
+    # texts are tokenized per batch in collate_fn
     if class_index_dict is not None:
         # https://stackoverflow.com/questions/48004243/how-to-share-large-read-only-dictionary-list-across-processes-in-multiprocessing
         # https://stackoverflow.com/questions/45693949/storing-strings-in-a-multiprocessing-sharedctypes-array
@@ -648,33 +811,43 @@ def preprocess(
             sample["class_label"][class_index_dict[x]] = 1
         sample["class_label"] = torch.tensor(sample["class_label"]).float()
     del sample[text_ext]
-    sample["audio_name"] = sample["__key__"].split("/")[-1] + "." + audio_ext
-    sample["text_name"] = sample["__key__"].split("/")[-1] + "." + text_ext
+    key_name = sample["__key__"].rsplit("/", 1)[-1]
+    sample["audio_name"] = key_name + "." + audio_ext
+    sample["text_name"] = key_name + "." + text_ext
     sample["audio_orig_sr"] = orig_sr
     return sample
 
 
-def collate_fn(batch):
+def collate_fn(batch, max_len=None):
     """
     Collate function for wdsdataloader.
     batch: a list of dict, each dict is a sample
+    max_len: if given, waveforms are copied into a zero-initialized (batch, max_len) buffer,
+        which pads the samples that preprocess left shorter than max_len.
     """
     # concatenate values in each dictionary. if it is a tensor, concatenate. if it is a list, extend.
     batch_dict = {}
     for k in batch[0].keys():
-        if isinstance(batch[0][k], dict):  # dealwith bert tokenizer output
-            batch_dict[k] = {}
-            for kk in batch[0][k].keys():
-                tmp = []
-                for i in range(len(batch)):
-                    tmp.append(batch[i][k][kk])
-                batch_dict[k][kk] = torch.vstack(tmp)
+        if k == "waveform" and max_len is not None:
+            waveforms = torch.zeros((len(batch), max_len))
+            for i, sample in enumerate(batch):
+                waveforms[i, :len(sample[k])] = sample[k]
+            batch_dict[k] = waveforms
+        elif isinstance(batch[0][k], dict):  # dealwith bert tokenizer output
+            batch_dict[k] = {
+                kk: torch.vstack([sample[k][kk] for sample in batch])
+                for kk in batch[0][k]
+            }
         elif isinstance(batch[0][k], torch.Tensor):
             batch_dict[k] = torch.stack([sample[k] for sample in batch])
         elif isinstance(batch[0][k], np.ndarray):
             batch_dict[k] = torch.tensor(np.stack([sample[k] for sample in batch]))
         else:
             batch_dict[k] = [sample[k] for sample in batch]
+    if "raw_text" in batch_dict and "text" not in batch_dict:
+        # a single-element list of texts is tokenized the same as the text itself
+        texts = [t[0] if isinstance(t, list) else t for t in batch_dict["raw_text"]]
+        batch_dict["text"] = batch_tokenizer(texts)  # text shape: [batch, num_token]
     return batch_dict
 
 
@@ -776,7 +949,7 @@ def get_wds_dataset(
         wds.batched(
             args.batch_size,
             partial=not (is_train or args.parallel_eval),
-            collation_fn=collate_fn,
+            collation_fn=partial(collate_fn, max_len=max_len),
         )
     )
 
@@ -803,9 +976,21 @@ def get_wds_dataset(
     kwargs = {}
     if args.horovod:  # multi-node training on summit
         kwargs["multiprocessing_context"] = "forkserver"
+    if args.workers > 0:
+        # a small prefetch bounds the pinned memory held per worker
+        kwargs["prefetch_factor"] = 2
+        if is_train:
+            # keep the training workers alive across epochs, the shard and sample shuffle
+            # states then carry over between epochs instead of restarting from the seed
+            kwargs["persistent_workers"] = True
 
     dataloader = wds.WebLoader(
-        dataset, batch_size=None, shuffle=False, num_workers=args.workers, **kwargs
+        dataset,
+        batch_size=None,
+        shuffle=False,
+        num_workers=args.workers,
+        pin_memory=True,
+        **kwargs,
     )
 
     # FIXME not clear which approach is better, with_epoch before vs after dataloader?
@@ -829,6 +1014,121 @@ def get_wds_dataset(
     return DataInfo(dataloader, None)
 
 
+class DaliLoader:
+    """
+    Wrap a DALIGenericIterator to yield the same batch dicts as the webdataset collate_fn.
+    """
+
+    def __init__(self, iterator, num_batches, num_samples, text_augment_selection=None):
+        self.iterator = iterator
+        self.num_batches = num_batches
+        self.num_samples = num_samples
+        self.text_augment_selection = text_augment_selection
+
+    def __iter__(self):
+        for outputs in self.iterator:
+            batch = outputs[0]
+            raw_texts = []
+            for json_bytes in batch["json"].cpu().numpy():
+                # the json bytes are zero-padded to the longest one in the batch
+                json_bytes = json_bytes.tobytes().rstrip(b"\0")
+                json_dict_raw = load_json_bytes(json_bytes)
+                texts = select_text(json_dict_raw, self.text_augment_selection)
+                if isinstance(texts, list):
+                    texts = random.choice(texts)
+                raw_texts.append(texts)
+            yield {
+                "waveform": batch["waveform"],
+                "longer": batch["longer"].view(-1, 1),
+                "raw_text": raw_texts,
+                "text": batch_tokenizer(raw_texts),
+            }
+
+    def __len__(self):
+        return self.num_batches
+
+
+def get_dali_dataset(args, model_cfg, is_train, max_len=480000):
+    """
+    Get a dataset for local tars, decoded with NVIDIA DALI and resampled and cropped on the GPU.
+    Only training is supported, evaluation uses the webdataset pipeline.
+    """
+    if not is_train:
+        return get_wds_dataset(args, model_cfg, is_train, max_len=max_len)
+    assert dali_fn is not None, "Please install NVIDIA DALI to use the dali dataset type."
+    assert not args.remotedata, "The dali dataset type only supports local tars."
+    if args.data_truncating != "rand_trunc" or args.data_filling != "pad":
+        raise NotImplementedError(
+            "The dali dataset type only supports data_truncating rand_trunc and data_filling pad"
+        )
+    if args.class_index_dict is not None:
+        raise NotImplementedError("The dali dataset type does not support class labels")
+
+    sample_rate = model_cfg["audio_cfg"]["sample_rate"]
+
+    @pipeline_def(
+        batch_size=args.batch_size,
+        num_threads=max(1, args.workers),
+        device_id=torch.device(args.device).index or 0,
+        seed=args.seed + args.rank,
+    )
+    def audio_pipeline():
+        audio, text = dali_fn.readers.webdataset(
+            paths=args.train_data,
+            ext=["flac", "json"],
+            missing_component_behavior="skip",
+            random_shuffle=True,
+            initial_fill=_SAMPLE_SHUFFLE_SIZE,
+            shard_id=args.rank,
+            num_shards=args.world_size,
+            name="reader",
+        )
+        audio, orig_sr = dali_fn.decoders.audio(audio, dtype=dali_types.FLOAT, downmix=True)
+        # same quantization as int16_to_float32(float32_to_int16(audio)): clip, scale and truncate towards zero
+        audio = dali_math.clamp(audio, -1.0, 1.0) * 32767.0
+        sign = dali_fn.cast(audio > 0, dtype=dali_types.FLOAT) - dali_fn.cast(audio < 0, dtype=dali_types.FLOAT)
+        audio = dali_math.floor(dali_math.abs(audio)) * sign / 32767.0
+        # length and random crop start after resampling, computed on the cpu
+        length = dali_fn.cast(dali_fn.shapes(audio), dtype=dali_types.FLOAT) * sample_rate / orig_sr
+        overflow = length - max_len
+        longer = overflow > 0
+        start = dali_fn.cast(
+            dali_fn.random.uniform(range=[0.0, 1.0], shape=[1]) * (overflow + 1) * longer,
+            dtype=dali_types.INT64,
+        )
+        audio = dali_fn.audio_resample(audio.gpu(), in_rate=orig_sr, out_rate=sample_rate)
+        # crop long clips and zero-pad short ones to max_len
+        audio = dali_fn.slice(
+            audio,
+            start=start,
+            shape=[max_len],
+            axes=[0],
+            out_of_bounds_policy="pad",
+            fill_values=0.0,
+        )
+        return audio, longer, dali_fn.pad(text, fill_value=0)
+
+    pipeline = audio_pipeline()
+    pipeline.build()
+    iterator = DALIGenericIterator(
+        [pipeline],
+        ["waveform", "longer", "json"],
+        reader_name="reader",
+        last_batch_policy=LastBatchPolicy.DROP,
+        auto_reset=True,
+    )
+    # the iterator knows the batches actually produced per epoch (skipped samples, dropped last batch)
+    num_batches = len(iterator)
+    dataloader = DaliLoader(
+        iterator,
+        num_batches=num_batches,
+        num_samples=num_batches * args.batch_size * args.world_size,
+        text_augment_selection=args.text_augment_selection,
+    )
+
+    return DataInfo(dataloader, None)
+
+
 def wds_batch_list2dict(
     batch,
     keys=[
@@ -860,6 +1160,7 @@ def get_csv_dataset(args, preprocess_fn, is_train):
         img_key=args.csv_img_key,
         caption_key=args.csv_caption_key,
         sep=args.csv_separator,
+        decoder=args.csv_img_decoder,
     )
     num_samples = len(dataset)
     sampler = DistributedSampler(dataset) if args.distributed and is_train else None
@@ -873,6 +1174,7 @@ def get_csv_dataset(args, preprocess_fn, is_train):
         pin_memory=True,
         sampler=sampler,
         drop_last=is_train,
+        collate_fn=csv_collate_fn,
     )
     dataloader.num_samples = num_samples
     dataloader.num_batches = len(dataloader)
@@ -925,6 +1227,8 @@ def get_dataset_fn(data_path, dataset_type):
             )
     elif dataset_type == "toy":
         return get_toy_dataset
+    elif dataset_type == "dali":
+        return get_dali_dataset
     else:
         raise ValueError(f"Unsupported dataset type: {dataset_type}")
 
@@ -936,7 +1240,7 @@ def get_data(args, model_cfg):
 
     if args.datasetinfos is None:
         args.datasetinfos = ["train", "unbalanced_train", "balanced_train"]
-    if args.dataset_type == "webdataset":
+    if args.dataset_type in ["webdataset", "dali"]:
         args.train_data = get_tar_path_from_dataset_name(
             args.datasetnames,
             args.datasetinfos,
@@ -0,0 +1,45 @@
+import logging
+import math
+
+import numpy as np
+import torch
+from scipy.signal import resample_poly
+
+try:
+    import torchaudio
+except ImportError:
+    torchaudio = None
+
+
+def int16_to_float32(x):
+    return x.astype(np.float32) / np.float32(32767.0)
+
+
+def float32_to_int16(x):
+    x = np.clip(x, a_min=-1., a_max=1.)
+    return (x * 32767.).astype(np.int16)
+
+
+_RESAMPLERS = {}
+
+
+def resample(audio_data, orig_sr, target_sr):
+    """
+    Resample a waveform tensor of shape (T) from orig_sr to target_sr.
+    The torchaudio kernel is built once per (orig_sr, target_sr) pair and reused,
+    since most shards share a single source sample rate.
+    """
+    if torchaudio is None:
+        g = math.gcd(orig_sr, target_sr)
+        audio_data = resample_poly(audio_data.numpy(), target_sr // g, orig_sr // g)
+        return torch.from_numpy(audio_data.astype(np.float32, copy=False))
+    key = (orig_sr, target_sr)
+    if key not in _RESAMPLERS:
+        _RESAMPLERS[key] = torchaudio.transforms.Resample(orig_sr, target_sr)
+    return _RESAMPLERS[key](audio_data)
+
+
+def log_and_continue(exn):
+    """Call in an exception handler to ignore any exception, isssue a warning, and continue."""
+    logging.warning(f"Handling webdataset error ({repr(exn)}). Ignoring.")
+    return True
@@ -62,9 +62,9 @@ def parse_args():
     )
     parser.add_argument(
         "--dataset-type",
-        choices=["webdataset", "csv", "auto", "toy"],
+        choices=["webdataset", "csv", "auto", "toy", "dali"],
         default="auto",
-        help="Which type of dataset to process.",
+        help="Which type of dataset to process. dali decodes and resamples local training tars with NVIDIA DALI.",
     )
     parser.add_argument(
         "--csv-separator",
@@ -84,6 +84,12 @@ def parse_args():
         default="title",
         help="For csv-like datasets, the name of the key for the captions.",
     )
+    parser.add_argument(
+        "--csv-img-decoder",
+        choices=["pil", "turbojpeg"],
+        default="pil",
+        help="For csv-like datasets, the decoder of jpeg images. turbojpeg requires PyTurboJPEG.",
+    )
     parser.add_argument(
         "--imagenet-val",
         type=str,